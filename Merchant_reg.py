@@ -1,6 +1,7 @@
 import flet as ft
 import csv
 import os
+import re
 
 CSV_FILENAME = "merchant.csv"
 CSV_HEADERS = [
@@ -11,7 +12,7 @@ CSV_HEADERS = [
     "Account_Holder_Name"
 ]
 
-ALLOWED_BANKS = {
+ALLOWED_BANKS = frozenset({
     "DBS Bank Ltd",
     "OCBC Bank",
     "UOB Bank",
@@ -22,7 +23,20 @@ ALLOWED_BANKS = {
     "Citibank Singapore",
     "RHB Bank Berhad",
     "Bank of China Singapore",
-}
+})
+
+# Sorted once at import; every Flet session reuses this for the dropdown
+# instead of re-sorting the set.
+BANKS_SORTED = tuple(sorted(ALLOWED_BANKS))
+
+# Exactly nine ASCII digits; compiled once, bound to .match for the hot path.
+_ACCT_OK = re.compile(r"\A\d{9}\Z", re.ASCII).match
+
+# Fixed response messages, built once instead of per submission.
+MSG_INVALID_BANK = "❌ Invalid Bank Name."
+MSG_INVALID_ACCT = "❌ Account Number must be exactly 9 digits."
+MSG_MISSING_FIELDS = "❌ All fields are required."
+MSG_CHECK_DETAILS = "⚠️ Please double check the information you entered."
 
 def ensure_csv_exists_with_header():
     if not os.path.exists(CSV_FILENAME):
@@ -30,6 +44,46 @@ def ensure_csv_exists_with_header():
             writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
             writer.writeheader()
 
+# In-memory view of merchant.csv so each registration does dict/list work
+# instead of re-reading and re-parsing the file. Invalidated whenever the
+# file's mtime changes (e.g. the CSV was edited by hand or another process).
+_MERCHANT_CACHE = {"mtime": None, "by_bank_acct": {}, "max_id": 0}
+
+def _refresh_merchant_cache():
+    ensure_csv_exists_with_header()
+    mtime = os.stat(CSV_FILENAME).st_mtime_ns
+    if mtime == _MERCHANT_CACHE["mtime"]:
+        return
+    by_bank_acct = {}
+    max_num = 0
+    # 1 MB read buffer: full-file scans issue far fewer read() syscalls
+    # than with the default 8 KB buffer.
+    with open(CSV_FILENAME, "r", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        # csv.reader + positional indices: no per-row dict allocation.
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header:
+            i_mid = header.index("Merchant_ID")
+            i_name = header.index("Merchant_Name")
+            i_bank = header.index("Bank_Name")
+            i_acct = header.index("Account_Number")
+            i_holder = header.index("Account_Holder_Name")
+            for row in reader:
+                if len(row) < len(CSV_HEADERS):
+                    continue
+                mid = row[i_mid].strip()
+                key = (row[i_bank].strip(), row[i_acct].strip())
+                # setdefault keeps the first row per (bank, account), matching
+                # the old first-match linear scan.
+                by_bank_acct.setdefault(
+                    key, (mid, row[i_name].strip().lower(), row[i_holder].strip().lower())
+                )
+                if mid.startswith("M") and mid[1:].isdigit():
+                    max_num = max(max_num, int(mid[1:]))
+    _MERCHANT_CACHE["by_bank_acct"] = by_bank_acct
+    _MERCHANT_CACHE["max_id"] = max_num
+    _MERCHANT_CACHE["mtime"] = mtime
+
 def find_existing_merchant(bank_name: str, account_number: str,
                            merchant_name: str, account_holder: str) -> tuple[str | None, bool]:
     """
@@ -37,41 +91,60 @@ def find_existing_merchant(bank_name: str, account_number: str,
     - Merchant_ID if any merchant has same bank+account.
     - exact_match_flag True if all fields match (name, bank, account, holder).
     """
-    if not os.path.exists(CSV_FILENAME):
+    _refresh_merchant_cache()
+    rec = _MERCHANT_CACHE["by_bank_acct"].get((bank_name, account_number))
+    if rec is None:
         return None, False
-
-    with open(CSV_FILENAME, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            existing_bank = (row.get("Bank_Name") or "").strip()
-            existing_acct = (row.get("Account_Number") or "").strip()
-            if existing_bank == bank_name and existing_acct == account_number:
-                existing_id = (row.get("Merchant_ID") or "").strip() or None
-                # Check full match
-                same_name = (row.get("Merchant_Name") or "").strip().lower() == merchant_name.lower()
-                same_holder = (row.get("Account_Holder_Name") or "").strip().lower() == account_holder.lower()
-                if same_name and same_holder:
-                    return existing_id, True
-                else:
-                    return existing_id, False
-    return None, False
+    mid, name_lower, holder_lower = rec
+    exact = (name_lower == merchant_name.lower()
+             and holder_lower == account_holder.lower())
+    return (mid or None), exact
+
+# Sidecar file holding the next Merchant_ID number so ID generation stays
+# O(1) across restarts instead of re-deriving the max from the whole CSV.
+NEXTID_SIDECAR = CSV_FILENAME + ".nextid"
+
+def _read_next_id_num() -> int:
+    try:
+        with open(NEXTID_SIDECAR, "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+def _write_next_id_num(num: int):
+    tmp = NEXTID_SIDECAR + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(num))
+    os.replace(tmp, NEXTID_SIDECAR)
 
 def get_next_merchant_id() -> str:
-    ensure_csv_exists_with_header()
-    max_num = 0
-    with open(CSV_FILENAME, "r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            mid = (row.get("Merchant_ID") or "").strip()
-            if mid.startswith("M") and mid[1:].isdigit():
-                max_num = max(max_num, int(mid[1:]))
-    return f"M{max_num + 1:03d}"
+    _refresh_merchant_cache()
+    num = _read_next_id_num()
+    if num <= _MERCHANT_CACHE["max_id"]:
+        # Sidecar missing or stale (e.g. CSV edited by hand): re-seed it
+        # from the cached max once, then trust it from here on.
+        num = _MERCHANT_CACHE["max_id"] + 1
+        _write_next_id_num(num)
+    return f"M{num:03d}"
 
 def append_to_csv(row: dict):
     ensure_csv_exists_with_header()
     with open(CSV_FILENAME, "a", newline="", encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
         writer.writerow(row)
+    # Keep the cache in step with the append so the next request does not
+    # need to re-read the file just because we wrote to it ourselves.
+    key = ((row.get("Bank_Name") or "").strip(), (row.get("Account_Number") or "").strip())
+    _MERCHANT_CACHE["by_bank_acct"].setdefault(key, (
+        (row.get("Merchant_ID") or "").strip(),
+        (row.get("Merchant_Name") or "").strip().lower(),
+        (row.get("Account_Holder_Name") or "").strip().lower(),
+    ))
+    mid = (row.get("Merchant_ID") or "").strip()
+    if mid.startswith("M") and mid[1:].isdigit():
+        _MERCHANT_CACHE["max_id"] = max(_MERCHANT_CACHE["max_id"], int(mid[1:]))
+        _write_next_id_num(_MERCHANT_CACHE["max_id"] + 1)
+    _MERCHANT_CACHE["mtime"] = os.stat(CSV_FILENAME).st_mtime_ns
 
 def main(page: ft.Page):
     page.title = "Merchant Registration"
@@ -82,7 +155,7 @@ def main(page: ft.Page):
     merchant_name = ft.TextField(label="Merchant Name", width=400, bgcolor=ft.Colors.WHITE, border_radius=8)
     bank_name = ft.Dropdown(
         label="Bank Name",
-        options=[ft.dropdown.Option(b) for b in sorted(ALLOWED_BANKS)],
+        options=[ft.dropdown.Option(b) for b in BANKS_SORTED],
         width=400
     )
     account_number = ft.TextField(
@@ -104,13 +177,13 @@ def main(page: ft.Page):
 
         # Validation
         if b_name not in ALLOWED_BANKS:
-            result_text.value = "❌ Invalid Bank Name."
+            result_text.value = MSG_INVALID_BANK
             result_text.color = ft.Colors.RED
-        elif not (acct_num.isdigit() and len(acct_num) == 9):
-            result_text.value = "❌ Account Number must be exactly 9 digits."
+        elif not _ACCT_OK(acct_num):
+            result_text.value = MSG_INVALID_ACCT
             result_text.color = ft.Colors.RED
         elif not all([m_name, b_name, acct_num, acct_holder]):
-            result_text.value = "❌ All fields are required."
+            result_text.value = MSG_MISSING_FIELDS
             result_text.color = ft.Colors.RED
         else:
             existing_id, exact_match = find_existing_merchant(b_name, acct_num, m_name, acct_holder)
@@ -119,7 +192,7 @@ def main(page: ft.Page):
                     result_text.value = f"⚠️ Already registered. Merchant_ID: {existing_id}"
                     result_text.color = ft.Colors.ORANGE
                 else:
-                    result_text.value = "⚠️ Please double check the information you entered."
+                    result_text.value = MSG_CHECK_DETAILS
                     result_text.color = ft.Colors.ORANGE
             else:
                 merchant_id = get_next_merchant_id()
@@ -1,13 +1,15 @@
 import flet as ft
-import json
 import os
 import time
 import random
 import barcode
 import base64
+from io import BytesIO
 from barcode.writer import ImageWriter
 from data_structure import HouseholdRegistry
 
+import jsonio
+
 # Initialize registry
 registry = HouseholdRegistry(
     data_dir="data",
@@ -16,44 +18,41 @@ registry = HouseholdRegistry(
     voucher_counts={2: 80, 5: 32, 10: 45}
 )
 
-ACTIVATION_LOG = "data/activations.json"
-BARCODE_DIR = "data/barcodes"
-
-os.makedirs(BARCODE_DIR, exist_ok=True)
-
-def encode_image_base64(path):
-    with open(path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+ACTIVATION_LOG = "data/activations.jsonl"
 
 def generate_barcode():
     """Generate a 13-digit numeric barcode string"""
-    return "".join([str(random.randint(0, 9)) for _ in range(13)])
+    # One RNG draw formatted to 13 digits instead of 13 randint calls.
+    return f"{random.randrange(10 ** 13):013d}"
 
-def save_barcode_image(barcode_number):
+def render_barcode(barcode_number):
+    """Render the EAN-13 PNG in memory; return (base64_png, full_code)."""
     ean = barcode.get("ean13", barcode_number, writer=ImageWriter())
-    filename = os.path.join(BARCODE_DIR, str(barcode_number))
-    result = ean.save(filename)
-    if isinstance(result, tuple):
-        result = result[0]
-    return result, ean.get_fullcode()
+    buf = BytesIO()
+    ean.write(buf)
+    return base64.b64encode(buf.getvalue()).decode("ascii"), ean.get_fullcode()
 
 def save_activation(barcode_number, voucher_codes):
     os.makedirs("data", exist_ok=True)
 
-    try:
-        with open(ACTIVATION_LOG, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        data = []
+    # Embed the parsed (hid, denom, idx) triples alongside the codes so
+    # redemption can use them directly instead of re-parsing every code.
+    vouchers = []
+    for code in voucher_codes:
+        hid, denom, idx = HouseholdRegistry.parse_voucher_code(code)
+        vouchers.append({"code": code, "hid": hid, "denom": denom, "idx": idx})
 
-    data.append({
+    record = {
         "barcode": barcode_number,
         "voucher_codes": voucher_codes,
+        "vouchers": vouchers,
         "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-    })
+    }
 
-    with open(ACTIVATION_LOG, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    # JSON-Lines append: one record per line, no read-modify-write of the
+    # whole log. O(1) per activation no matter how large the log grows.
+    with open(ACTIVATION_LOG, "ab") as f:
+        f.write(jsonio.dumps(record) + b"\n")
 
     print("Activation saved:", barcode_number, voucher_codes)
 
@@ -66,7 +65,7 @@ def main(page: ft.Page):
     household_id_input = ft.TextField(label="Enter Household ID")
     message = ft.Text(value="", color="red")
 
-    selected_vouchers = []
+    selected_vouchers = set()  # O(1) membership on every toggle
 
     # ✅ store UI reference locally (don’t use session for Controls)
     proceed_btn_ref = {"btn": None}
@@ -77,8 +76,11 @@ def main(page: ft.Page):
         page.update()
 
     def login(e):
-        # Re-initialize registry from files each time login is attempted
+        # Re-initialize registry from files each time login is attempted.
+        # Close the old one first so its writer thread and atexit hook do
+        # not keep it alive (one leak per login otherwise).
         global registry
+        registry.close()
         registry = HouseholdRegistry(
             data_dir="data",
             households_csv="households.csv",
@@ -103,30 +105,34 @@ def main(page: ft.Page):
         state = registry.household_voucher_state[hid]
         buttons = []
 
-        total_balance = sum(int(denom) for denom, arr in state.items() for val in arr if val == 0)
+        total_balance = registry.total_balance(hid)
 
         page.add(
             ft.Text(f"Household {hid} - Select vouchers", size=20, weight="bold"),
             ft.Text(f"Total Available Balance: ${total_balance}", size=18, color="blue", weight="bold")
         )
 
-        for denom, arr in state.items():
-            for idx, val in enumerate(arr):
-                code = registry.format_voucher_code(hid, int(denom), idx + 1)
+        codes = registry.voucher_codes(hid)
+        for denom, count in registry.voucher_counts.items():
+            mask = state[str(denom)]
+            denom_codes = codes[denom]
+            for idx in range(count):
+                used = mask >> idx & 1
+                code = denom_codes[idx]
 
                 btn = ft.ElevatedButton(
                     content=ft.Text(f"${denom} #{idx+1}"),
                     width=120,
-                    bgcolor="white" if val == 0 else "grey",
-                    disabled=(val == 1),
+                    bgcolor="white" if not used else "grey",
+                    disabled=bool(used),
                 )
 
                 def on_click(ev, c=code, b=btn):
                     if c in selected_vouchers:
-                        selected_vouchers.remove(c)
+                        selected_vouchers.discard(c)
                         b.bgcolor = "white"
                     else:
-                        selected_vouchers.append(c)
+                        selected_vouchers.add(c)
                         b.bgcolor = "lightblue"
                     toggle_proceed_button()
                     page.update()
@@ -160,17 +166,18 @@ def main(page: ft.Page):
 
     def activate_vouchers(hid):
         barcode_number = generate_barcode()
-        barcode_file, full_code = save_barcode_image(barcode_number)
+        barcode_b64, full_code = render_barcode(barcode_number)
 
-        save_activation(full_code, selected_vouchers)
+        activated_codes = sorted(selected_vouchers)
+        save_activation(full_code, activated_codes)
 
         page.controls.clear()
         page.add(
             ft.Text("Activation Successful!", size=22, weight="bold", color="green"),
             ft.Text(f"Barcode Number:\n{full_code}", selectable=True),
-            ft.Image(src=f"data:image/png;base64,{encode_image_base64(barcode_file)}",width=300,height=150,),
+            ft.Image(src=f"data:image/png;base64,{barcode_b64}",width=300,height=150,),
             ft.Text("Activated Vouchers:", size=18, weight="bold"),
-            ft.Text("\n".join(selected_vouchers), selectable=True),
+            ft.Text("\n".join(activated_codes), selectable=True),
             ft.ElevatedButton("Back to Home", on_click=go_home)
         )
         page.update()
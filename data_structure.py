@@ -1,7 +1,11 @@
+import atexit
 import csv
-import json
 import os
 import re
+import threading
+import time
+
+import jsonio
 
 class HouseholdRegistry:
     """
@@ -10,7 +14,9 @@ class HouseholdRegistry:
     - Stores households in CSV/JSON
     """
 
-    # Singapore NRIC/FIN format: prefix S/T/F/G, 7 digits, checksum letter
+    # Singapore NRIC/FIN format: prefix S/T/F/G/M, 7 digits, checksum letter.
+    # Kept as documentation of the format; validation itself uses the
+    # cheaper character-level checks in is_valid_fin_or_nric.
     FIN_NRIC_PATTERN = re.compile(r"^[STFGM]\d{7}[A-Z]$")
 
     def __init__(self,
@@ -21,18 +27,51 @@ class HouseholdRegistry:
         self.data_dir = data_dir
         self.households_csv_path = os.path.join(data_dir, households_csv)
         self.voucher_state_json_path = os.path.join(data_dir, voucher_state_json)
+        # Write-ahead log next to the snapshot (voucher_state.log): every
+        # mutation is appended here immediately, so a crash inside the
+        # debounce window loses nothing — boot replays the log on top of
+        # the last snapshot.
+        self.voucher_state_log_path = (
+            os.path.splitext(self.voucher_state_json_path)[0] + ".log"
+        )
         self.voucher_counts = voucher_counts or {2: 80, 5: 32, 10: 45}
 
         # In-memory
         self.fin_to_household = {}
         self.household_voucher_state = {}
+        # Lazily built voucher-code lists per household; the codes are
+        # deterministic so they never need to be re-formatted per render.
+        self._codes_cache = {}
+        # Highest household number seen so far, maintained incrementally so
+        # new-ID generation never has to rescan fin_to_household.values().
+        self._max_hid_num = 0
+        # True whenever the in-memory voucher state has changes that have
+        # not been written back to disk yet.
+        self._dirty = False
+        # mtime of the voucher-state file at the last load/save, so a
+        # repeated load_voucher_state call is a stat, not a JSON parse.
+        self._loaded_mtime_ns = None
+        # Guards voucher-state mutation and serialization; the background
+        # writer and UI callbacks can touch the state concurrently.
+        self._state_lock = threading.RLock()
+        self._flush_event = threading.Event()
+        # Debounced writer thread; started lazily by the first mark_dirty
+        # so a registry that never mutates state never owns a thread.
+        self._writer_thread = None
+        # Set by close(): stops the writer and blocks it from restarting,
+        # so a replaced registry can actually be garbage-collected.
+        self._closed = False
 
         # Boot
         self.ensure_data_dir()
         self.load_households()
         self.load_voucher_state()
+        self._replay_state_log()
         self.ensure_voucher_state_for_all()
-        self.save_voucher_state()
+        # Only rewrite the JSON if the boot actually changed anything
+        # (e.g. a household was missing its voucher pool).
+        self.flush()
+        atexit.register(self.flush)
 
     # ---------- Utilities ----------
     def ensure_data_dir(self):
@@ -42,57 +81,327 @@ class HouseholdRegistry:
         return fin.strip().upper()
 
     def is_valid_fin_or_nric(self, fin: str) -> bool:
-        """Check if input matches FIN/NRIC pattern."""
-        return bool(self.FIN_NRIC_PATTERN.match(fin))
+        """Check if input matches the FIN/NRIC format.
+
+        Direct character tests on the fixed 9-char layout, avoiding the
+        regex engine per check. isdecimal (not isdigit) matches the \\d
+        semantics of FIN_NRIC_PATTERN: isdigit also accepts characters
+        like superscripts that \\d rejects.
+        """
+        return (
+            len(fin) == 9
+            and fin[0] in "STFGM"
+            and fin[1:8].isdecimal()
+            and "A" <= fin[8] <= "Z"
+        )
 
     # ---------- Persistence ----------
     def load_households(self):
+        """Load the FIN -> Household_ID map.
+
+        The file is append-only in normal operation, so duplicate FIN rows
+        are possible after a recovery; the last row wins.
+        """
         if not os.path.exists(self.households_csv_path):
             return
-        with open(self.households_csv_path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
+        # 1 MB read buffer to cut syscalls on the full-file scan.
+        with open(self.households_csv_path, newline="", encoding="utf-8", buffering=1 << 20) as f:
+            # Two fixed columns: csv.reader avoids a dict allocation per row.
+            reader = csv.reader(f)
+            next(reader, None)  # header
             for row in reader:
-                fin = row.get("FIN", "").strip()
-                hid = row.get("Household_ID", "").strip()
+                if len(row) < 2:
+                    continue
+                fin = row[0].strip()
+                hid = row[1].strip()
                 if fin and hid:
                     self.fin_to_household[fin] = hid
+                    if hid.startswith("H") and hid[1:].isdigit():
+                        self._max_hid_num = max(self._max_hid_num, int(hid[1:]))
 
     def load_voucher_state(self):
         if not os.path.exists(self.voucher_state_json_path):
             return
-        with open(self.voucher_state_json_path, encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                self.household_voucher_state.update(data)
+        mtime = os.stat(self.voucher_state_json_path).st_mtime_ns
+        # The dirty check, parse and state replacement all happen under
+        # the state lock: a reload racing a concurrent mark could
+        # otherwise overwrite a just-set bit with stale file data, and
+        # the next snapshot would persist the stale mask and truncate the
+        # WAL line that recorded it.
+        with self._state_lock:
+            if mtime == self._loaded_mtime_ns or self._dirty:
+                # In-memory state is current with (or ahead of) the file;
+                # skip the full JSON parse.
+                return
+            with open(self.voucher_state_json_path, "rb") as f:
+                data = jsonio.loads(f.read())
+            self._loaded_mtime_ns = mtime
+            if not isinstance(data, dict):
+                return
+            for hid, denoms in data.items():
+                if not isinstance(denoms, dict):
+                    continue
+                masks = {}
+                for denom, val in denoms.items():
+                    if isinstance(val, str):
+                        masks[denom] = int(val, 16)
+                    elif isinstance(val, list):
+                        # Legacy format: list of 0/1 flags, one per voucher.
+                        mask = 0
+                        for i, used in enumerate(val):
+                            if used:
+                                mask |= 1 << i
+                        masks[denom] = mask
+                    elif isinstance(val, int):
+                        masks[denom] = val
+                self.household_voucher_state[hid] = masks
 
     def save_households(self):
-        with open(self.households_csv_path, "w", newline="", encoding="utf-8") as f:
+        """Full rewrite of households.csv (compaction/recovery only)."""
+        tmp = self.households_csv_path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
             writer.writerow(["FIN", "Household_ID"])
             for fin, hid in self.fin_to_household.items():
                 writer.writerow([fin, hid])
+        os.replace(tmp, self.households_csv_path)
+
+    def append_household(self, fin: str, hid: str):
+        """Append a single new mapping instead of rewriting the whole CSV."""
+        need_header = not os.path.exists(self.households_csv_path)
+        with open(self.households_csv_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if need_header:
+                writer.writerow(["FIN", "Household_ID"])
+            writer.writerow([fin, hid])
 
     def save_voucher_state(self):
-        with open(self.voucher_state_json_path, "w", encoding="utf-8") as f:
-            json.dump(self.household_voucher_state, f, indent=2)
+        # The whole snapshot happens under the lock so no mutation can
+        # slip into the log between serializing and truncating it; the
+        # write is small and debounced, so mutators are barely delayed.
+        with self._state_lock:
+            if not self._dirty:
+                # Nothing changed since the last write; skip serializing
+                # the whole state.
+                return
+            serializable = {
+                hid: {denom: format(mask, "x") for denom, mask in masks.items()}
+                for hid, masks in self.household_voucher_state.items()
+            }
+            self._dirty = False
+            # Write-to-temp + atomic rename: a crash mid-write can never
+            # leave a truncated voucher_state.json behind.
+            tmp = self.voucher_state_json_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(jsonio.dumps(serializable))
+                # Force the bytes to disk before the rename: otherwise a
+                # power loss right after os.replace can leave the new name
+                # pointing at never-written data.
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.voucher_state_json_path)
+            # The snapshot now covers everything in the log; start fresh.
+            open(self.voucher_state_log_path, "wb").close()
+            self._loaded_mtime_ns = os.stat(self.voucher_state_json_path).st_mtime_ns
+
+    def _append_state_log(self, entries):
+        """Append mutations to the write-ahead log.
+
+        entries: iterable of (household_id, denom_str, bits). One ASCII
+        line per entry: "<hid> <denom> <hex bits>". The append hits the
+        OS page cache, so the bits survive a process crash even before
+        the debounced snapshot lands.
+        """
+        payload = b"".join(
+            f"{hid} {denom} {bits:x}\n".encode("ascii")
+            for hid, denom, bits in entries
+        )
+        with open(self.voucher_state_log_path, "ab") as f:
+            f.write(payload)
+
+    def _replay_state_log(self):
+        """Re-apply mutations logged after the last snapshot.
+
+        Replaying is an OR, so a line that already made it into the
+        snapshot is harmless to apply again.
+        """
+        if not os.path.exists(self.voucher_state_log_path):
+            return
+        replayed = False
+        with open(self.voucher_state_log_path, "rb") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 3:
+                    continue
+                hid = parts[0].decode("ascii")
+                denom = parts[1].decode("ascii")
+                bits = int(parts[2], 16)
+                masks = self.household_voucher_state.setdefault(
+                    hid, {str(d): 0 for d in self.voucher_counts}
+                )
+                masks[denom] = masks.get(denom, 0) | bits
+                replayed = True
+        if replayed:
+            # Fold the replayed bits into the next snapshot, which also
+            # truncates the log.
+            self.mark_dirty()
 
     # ---------- Core logic ----------
     def get_next_household_id(self) -> str:
-        if not self.fin_to_household:
-            return "H0001"
-        max_num = max(int(hid[1:]) for hid in self.fin_to_household.values() if hid.startswith("H"))
-        return f"H{max_num + 1:04d}"
+        return f"H{self._max_hid_num + 1:04d}"
 
     def init_voucher_state(self, household_id: str):
-        self.household_voucher_state[household_id] = {
-            str(denom): [0] * count for denom, count in self.voucher_counts.items()
-        }
+        # Each denomination's usage flags are packed into one int bitmask:
+        # bit (idx-1) set means voucher #idx is used. ~100x smaller than a
+        # list of 0/1 ints and bit ops are single C-level operations.
+        # The insert takes the lock: the writer thread iterates this dict
+        # while serializing, and an unlocked insert from a handler thread
+        # can blow up that iteration mid-snapshot.
+        with self._state_lock:
+            self.household_voucher_state[household_id] = {
+                str(denom): 0 for denom in self.voucher_counts
+            }
+        self.mark_dirty()
+
+    def is_voucher_used(self, household_id: str, denom: int, idx: int) -> bool:
+        """idx is 1-based, matching voucher codes."""
+        return bool(self.household_voucher_state[household_id][str(denom)] >> (idx - 1) & 1)
+
+    def mark_voucher_used(self, household_id: str, denom: int, idx: int):
+        """idx is 1-based, matching voucher codes."""
+        with self._state_lock:
+            self.household_voucher_state[household_id][str(denom)] |= 1 << (idx - 1)
+            self._append_state_log([(household_id, str(denom), 1 << (idx - 1))])
+        self.mark_dirty()
+
+    def mark_vouchers_used(self, vouchers):
+        """Bulk form of mark_voucher_used.
+
+        vouchers: iterable of (household_id, denom, idx) with 1-based idx.
+        The bits are combined per (household, denomination) first, so each
+        group costs a single OR instead of one store per voucher.
+        """
+        combined = {}
+        for hid, denom, idx in vouchers:
+            key = (hid, str(denom))
+            combined[key] = combined.get(key, 0) | 1 << (idx - 1)
+        with self._state_lock:
+            for (hid, denom), bits in combined.items():
+                self.household_voucher_state[hid][denom] |= bits
+            self._append_state_log(
+                (hid, denom, bits) for (hid, denom), bits in combined.items()
+            )
+        self.mark_dirty()
+
+    def any_voucher_used(self, vouchers) -> bool:
+        """Bulk form of is_voucher_used.
+
+        vouchers: iterable of (household_id, denom, idx) with 1-based idx.
+        The bits are combined per (household, denomination) first, so each
+        group costs a single AND against the stored mask instead of one
+        shift-and-test per voucher.
+        """
+        combined = {}
+        for hid, denom, idx in vouchers:
+            key = (hid, str(denom))
+            combined[key] = combined.get(key, 0) | 1 << (idx - 1)
+        state = self.household_voucher_state
+        return any(
+            state[hid][denom] & bits for (hid, denom), bits in combined.items()
+        )
+
+    def available_count(self, household_id: str, denom: int) -> int:
+        """How many vouchers of this denomination are still unused."""
+        mask = self.household_voucher_state[household_id][str(denom)]
+        return self.voucher_counts[denom] - mask.bit_count()
+
+    def total_balance(self, household_id: str) -> int:
+        """Dollar value of all unused vouchers: three bit_count ops,
+        not a walk over every slot."""
+        return sum(
+            denom * self.available_count(household_id, denom)
+            for denom in self.voucher_counts
+        )
+
+    def mark_dirty(self):
+        """Note a pending change and wake the debounced writer."""
+        self._dirty = True
+        if self._writer_thread is None:
+            with self._state_lock:
+                if self._writer_thread is None and not self._closed:
+                    # Debounced writer: bursts of mutations coalesce into
+                    # one write ~100 ms after the last mark_dirty instead
+                    # of one write each.
+                    self._writer_thread = threading.Thread(
+                        target=self._writer_loop,
+                        name="voucher-state-writer",
+                        daemon=True,
+                    )
+                    self._writer_thread.start()
+        self._flush_event.set()
+
+    def flush(self):
+        """Write the voucher state out if (and only if) it has changed."""
+        self.save_voucher_state()
+
+    def close(self):
+        """Flush pending state and stop the background writer.
+
+        Must be called before dropping the last reference to a registry
+        (e.g. when a fresh one is built over it), otherwise the writer
+        thread and the atexit hook keep the instance alive forever.
+        Safe to call more than once; the instance must not be used after.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        # Wake the writer so it can observe _closed and exit.
+        self._flush_event.set()
+        atexit.unregister(self.flush)
+        self.flush()
+
+    def _writer_loop(self):
+        while True:
+            self._flush_event.wait()
+            if self._closed:
+                break
+            time.sleep(0.1)  # debounce window: coalesce a burst into one write
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # A failed write (disk full, permissions, ...) must not
+                # kill the writer: the thread is never respawned, so dying
+                # here would silently end coalesced persistence for the
+                # rest of the process. Re-mark dirty so the next wake
+                # retries the full snapshot; the WAL and the atexit flush
+                # still cover the data meanwhile.
+                print("voucher-state writer: flush failed:", e)
+                self._dirty = True
+            if self._closed:
+                break
 
     def ensure_voucher_state_for_all(self):
         for hid in self.fin_to_household.values():
             if hid not in self.household_voucher_state:
                 self.init_voucher_state(hid)
 
+    def voucher_codes(self, household_id: str) -> dict[int, list[str]]:
+        """All voucher codes for a household, keyed by denomination.
+
+        Memoized: the codes are deterministic, so they are formatted once
+        per household instead of once per grid render.
+        """
+        codes = self._codes_cache.get(household_id)
+        if codes is None:
+            codes = {
+                denom: [self.format_voucher_code(household_id, denom, i + 1)
+                        for i in range(count)]
+                for denom, count in self.voucher_counts.items()
+            }
+            self._codes_cache[household_id] = codes
+        return codes
+
     @staticmethod
     def format_voucher_code(household_id: str, denom: int, idx: int) -> str:
         """
@@ -103,6 +412,10 @@ class HouseholdRegistry:
         """
         return f"V{denom:02d}-{idx:04d}-{household_id}"
 
+    # Compiled once at class creation; one match call validates the shape
+    # and captures all three fields instead of split + per-part checks.
+    VOUCHER_CODE_RE = re.compile(r"\AV(\d{2})-(\d{4})-([^-\s]+)\Z")
+
     @staticmethod
     def parse_voucher_code(code: str) -> tuple[str, int, int]:
         """
@@ -110,14 +423,10 @@ class HouseholdRegistry:
         Input: V02-0001-H0001
         Output: (household_id, denom, idx)
         """
-        parts = code.strip().split("-")
-        if len(parts) != 3 or not parts[0].startswith("V"):
+        m = HouseholdRegistry.VOUCHER_CODE_RE.match(code.strip())
+        if not m:
             raise ValueError("Invalid voucher code format. Expected: V02-0001-H0001")
-
-        denom = int(parts[0][1:])
-        idx = int(parts[1])
-        household_id = parts[2]
-        return household_id, denom, idx
+        return m.group(3), int(m.group(1)), int(m.group(2))
     
 
     # ---------- Main API ----------
@@ -133,17 +442,20 @@ class HouseholdRegistry:
             hid = self.fin_to_household[fin]
             already = True
             if hid not in self.household_voucher_state:
+                # init_voucher_state marks the state dirty; the debounced
+                # writer takes care of persisting it.
                 self.init_voucher_state(hid)
-                self.save_voucher_state()
             return fin, hid, already, None
 
         # New
         hid = self.get_next_household_id()
         self.fin_to_household[fin] = hid
+        self._max_hid_num += 1
         self.init_voucher_state(hid)
 
-        # Persist
-        self.save_households()
-        self.save_voucher_state()
+        # Persist: the new CSV row is appended right away; the voucher
+        # state was marked dirty by init_voucher_state and is flushed by
+        # the debounced writer.
+        self.append_household(fin, hid)
 
         return fin, hid, False, None
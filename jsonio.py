@@ -0,0 +1,24 @@
+"""Small JSON helpers shared by the voucher apps.
+
+Uses orjson (C-accelerated) when installed and falls back to the stdlib
+json module otherwise. Output is always compact bytes: indentation
+roughly doubles the file size and is several times slower to serialize.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    loads = orjson.loads
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    loads = json.loads
@@ -1,15 +1,20 @@
 import flet as ft
 import csv
+import io
 import os
-import json
+import threading
+from collections import defaultdict
 from datetime import datetime
 from data_structure import HouseholdRegistry
 
+import jsonio
+
 # ================== CONFIG ==================
 
 DATA_DIR = "data"
 TRANSACTIONS_CSV = f"{DATA_DIR}/transactions.csv"
 ACTIVATIONS_JSON = f"{DATA_DIR}/activations.json"
+ACTIVATIONS_JSONL = f"{DATA_DIR}/activations.jsonl"
 MERCHANT_CSV = "merchant.csv"
 
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -32,24 +37,180 @@ def ensure_transaction_csv_exists():
                 "Payment_Status", "Remarks"
             ])
 
+# The file only ever needs creating once per process; later appends can
+# assume it exists instead of re-statting before every transaction.
+ensure_transaction_csv_exists()
+
+# Incremental scan state: transactions.csv is append-only, so a re-scan
+# only has to parse the bytes written after the previous scan's offset.
+_tx_scan = {"offset": 0, "max_id": 0}
+
+def _scan_max_tx_id():
+    st = os.stat(TRANSACTIONS_CSV)
+    if st.st_size < _tx_scan["offset"]:
+        # File shrank (recreated/truncated): fall back to a full pass.
+        _tx_scan["offset"] = 0
+        _tx_scan["max_id"] = 0
+    if st.st_size > _tx_scan["offset"]:
+        max_id = _tx_scan["max_id"]
+        # Seek on the byte stream, then parse only the new tail. The
+        # Transaction_ID column is first, so positional access works for
+        # both the initial pass and incremental ones; the header row just
+        # fails the "TX" prefix test.
+        with open(TRANSACTIONS_CSV, "rb") as fb:
+            fb.seek(_tx_scan["offset"])
+            for row in csv.reader(io.TextIOWrapper(fb, encoding="utf-8", newline="")):
+                if not row:
+                    continue
+                tid = row[0]
+                if tid.startswith("TX") and tid[2:].isdigit():
+                    max_id = max(max_id, int(tid[2:]))
+        _tx_scan["offset"] = st.st_size
+        _tx_scan["max_id"] = max_id
+    return _tx_scan["max_id"]
+
+# Monotonic transaction counter: the CSV is scanned once to seed it, then
+# every redemption is a lock-protected increment instead of a file scan.
+_tx_lock = threading.Lock()
+_last_tx_num = None
+
 def get_next_transaction_id():
-    ensure_transaction_csv_exists()
-    max_id = 0
-    with open(TRANSACTIONS_CSV, "r", encoding="utf-8") as f:
-        for r in csv.DictReader(f):
-            tid = r.get("Transaction_ID", "")
-            if tid.startswith("TX") and tid[2:].isdigit():
-                max_id = max(max_id, int(tid[2:]))
-    return f"TX{max_id + 1:05d}"
+    global _last_tx_num
+    with _tx_lock:
+        if _last_tx_num is None:
+            _last_tx_num = _scan_max_tx_id()
+        _last_tx_num += 1
+        return f"TX{_last_tx_num:05d}"
+
+def load_activations():
+    """All activation records: legacy JSON array plus the JSONL append log."""
+    records = []
+    if os.path.exists(ACTIVATIONS_JSON):
+        with open(ACTIVATIONS_JSON, "rb") as f:
+            try:
+                records = jsonio.loads(f.read())
+            except ValueError:
+                records = []
+    if os.path.exists(ACTIVATIONS_JSONL):
+        with open(ACTIVATIONS_JSONL, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(jsonio.loads(line))
+    return records
+
+# merchant.csv parsed once into a dict keyed by Merchant_ID; re-read only
+# when the file's mtime changes. Logins become a dict lookup instead of a
+# CSV scan.
+_merchants_cache = {"mtime": None, "data": {}, "exists": False}
+_merchants_lock = threading.Lock()
+
+def _load_merchants():
+    with _merchants_lock:
+        _merchants_cache["exists"] = os.path.exists(MERCHANT_CSV)
+        if not _merchants_cache["exists"]:
+            _merchants_cache["mtime"] = None
+            _merchants_cache["data"] = {}
+            return _merchants_cache["data"]
+        mtime = os.stat(MERCHANT_CSV).st_mtime_ns
+        if mtime != _merchants_cache["mtime"]:
+            with open(MERCHANT_CSV, "r", encoding="utf-8") as f:
+                _merchants_cache["data"] = {
+                    r.get("Merchant_ID"): r for r in csv.DictReader(f)
+                }
+            _merchants_cache["mtime"] = mtime
+        return _merchants_cache["data"]
 
 def get_merchant_details(mid):
-    if not os.path.exists(MERCHANT_CSV):
-        return None
-    with open(MERCHANT_CSV, "r", encoding="utf-8") as f:
-        for r in csv.DictReader(f):
-            if r.get("Merchant_ID") == mid:
-                return r
-    return None
+    return _load_merchants().get(mid)
+
+# Transactions grouped by Merchant_ID so the history view reads only that
+# merchant's rows. Rebuilt when transactions.csv changes on disk; our own
+# appends update it in place.
+TX_HEADERS = [
+    "Transaction_ID", "Household_ID", "Merchant_ID",
+    "Transaction_Date_Time", "Voucher_Code",
+    "Denomination_Used", "Amount_Redeemed",
+    "Payment_Status", "Remarks"
+]
+# Columns the history view actually renders; index rows carry only these.
+HISTORY_FIELDS = (
+    "Transaction_ID", "Transaction_Date_Time",
+    "Voucher_Code", "Denomination_Used"
+)
+_tx_index = {"mtime": None, "by_merchant": defaultdict(list)}
+_tx_index_lock = threading.Lock()
+
+def _load_tx_index():
+    if not os.path.exists(TRANSACTIONS_CSV):
+        return _tx_index["by_merchant"]
+    mtime = os.stat(TRANSACTIONS_CSV).st_mtime_ns
+    with _tx_index_lock:
+        if mtime != _tx_index["mtime"]:
+            by_merchant = defaultdict(list)
+            with open(TRANSACTIONS_CSV, "r", newline="", encoding="utf-8") as f:
+                # Positional csv.reader; only the display columns are
+                # materialized per row.
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header and "Merchant_ID" in header:
+                    i_mid = header.index("Merchant_ID")
+                    idxs = [header.index(c) for c in HISTORY_FIELDS]
+                    needed = max(i_mid, *idxs)
+                    for row in reader:
+                        if len(row) <= needed:
+                            continue
+                        by_merchant[row[i_mid]].append(
+                            {c: row[i] for c, i in zip(HISTORY_FIELDS, idxs)}
+                        )
+            _tx_index["by_merchant"] = by_merchant
+            _tx_index["mtime"] = mtime
+        return _tx_index["by_merchant"]
+
+def _append_transactions(tx_rows):
+    """Write a redemption batch to transactions.csv and fold it into the
+    in-memory index.
+
+    Merchant_ID is typed at the login screen and merchant.csv is
+    hand-editable, so fields can carry commas, quotes or non-ASCII;
+    csv.writer into an in-memory buffer keeps the quoting rules while the
+    whole batch still lands in one append write. The file append and the
+    index update share one lock: if a rebuild ran between them, it would
+    already pick the new rows up from the file and the fold-in would then
+    add them a second time.
+    """
+    buf = io.StringIO()
+    csv.writer(buf).writerows(
+        [row[h] for h in TX_HEADERS] for row in tx_rows
+    )
+    with _tx_index_lock:
+        with open(TRANSACTIONS_CSV, "ab") as f:
+            f.write(buf.getvalue().encode("utf-8"))
+        if _tx_index["mtime"] is not None:
+            # Index not built yet otherwise; the first load picks them up.
+            for row in tx_rows:
+                _tx_index["by_merchant"][row.get("Merchant_ID", "")].append(
+                    {c: row[c] for c in HISTORY_FIELDS}
+                )
+            _tx_index["mtime"] = os.stat(TRANSACTIONS_CSV).st_mtime_ns
+
+# Activation records indexed by barcode so a redeem is a dict hit, not a
+# parse-and-scan of the whole log. Rebuilt when either file's mtime moves.
+_activations_cache = {"mtimes": None, "by_barcode": {}}
+_activations_lock = threading.Lock()
+
+def _get_activations():
+    mtimes = tuple(
+        os.stat(p).st_mtime_ns if os.path.exists(p) else None
+        for p in (ACTIVATIONS_JSON, ACTIVATIONS_JSONL)
+    )
+    with _activations_lock:
+        if mtimes != _activations_cache["mtimes"]:
+            _activations_cache["by_barcode"] = {
+                r.get("barcode"): r for r in load_activations()
+            }
+            _activations_cache["mtimes"] = mtimes
+        return _activations_cache["by_barcode"]
 
 # ================== APP ==================
 
@@ -61,8 +222,12 @@ def main(page: ft.Page):
 
     merchant_id = None  # <-- SAFE STATE STORAGE
 
-    def clear():
-        page.controls.clear()
+    # Each screen is built once (see the VIEWS section below) and stays on
+    # the page; navigation toggles visibility instead of tearing controls
+    # down and rebuilding the whole tree on every transition.
+    def _show(view):
+        for v in (login_view, dashboard_view, history_view, result_view):
+            v.visible = v is view
 
     # ================= LOGIN =================
 
@@ -70,30 +235,18 @@ def main(page: ft.Page):
     error_text = ft.Text(color=ft.Colors.RED)
 
     def show_login():
-        clear()
         merchant_input.value = ""
         error_text.value = ""
-
-        page.controls.append(
-            ft.Column(
-                [
-                    ft.Text("CDC Merchant Portal", size=24, weight=ft.FontWeight.BOLD),
-                    merchant_input,
-                    error_text,
-                    ft.ElevatedButton("Login", on_click=handle_login),
-                ],
-                alignment=ft.MainAxisAlignment.CENTER,
-                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                expand=True,
-            )
-        )
+        _show(login_view)
         page.update()
 
     def handle_login(e):
         nonlocal merchant_id
         mid = merchant_input.value.strip()
 
-        if get_merchant_details(mid) or not os.path.exists(MERCHANT_CSV):
+        # One _load_merchants call covers both the lookup and the
+        # file-exists fallback; no extra stat syscalls per login.
+        if mid in _load_merchants() or not _merchants_cache["exists"]:
             merchant_id = mid
             show_dashboard()
         else:
@@ -105,21 +258,8 @@ def main(page: ft.Page):
     barcode_input = ft.TextField(label="Scan / Enter Barcode")
 
     def show_dashboard():
-        clear()
         barcode_input.value = ""
-
-        page.controls.append(
-            ft.Column(
-                [
-                    ft.Text("Merchant Dashboard", size=20, weight=ft.FontWeight.BOLD),
-                    barcode_input,
-                    ft.ElevatedButton("Redeem Voucher", on_click=redeem_voucher),
-                    ft.OutlinedButton("View History", on_click=show_history),
-                    ft.TextButton("Logout", on_click=logout),
-                ],
-                expand=True,
-            )
-        )
+        _show(dashboard_view)
         page.update()
 
     # ================= REDEEM =================
@@ -131,114 +271,121 @@ def main(page: ft.Page):
 
         barcode = barcode_input.value.strip()
 
-        if not os.path.exists(ACTIVATIONS_JSON):
+        if not os.path.exists(ACTIVATIONS_JSON) and not os.path.exists(ACTIVATIONS_JSONL):
             show_result("Error", "Activation file missing", ft.Colors.RED)
             return
 
-        with open(ACTIVATIONS_JSON, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        record = next((r for r in data if r.get("barcode") == barcode), None)
+        record = _get_activations().get(barcode)
         if not record:
             show_result("Invalid", "Barcode not found", ft.Colors.RED)
             return
 
         registry.load_voucher_state()
 
-        vouchers = []
-        total = 0
-
-        for code in record["voucher_codes"]:
-            hid, denom, idx = registry.parse_voucher_code(code)
-            idx -= 1
-
-            if registry.household_voucher_state[hid][str(denom)][idx] == 1:
-                show_result("Declined", "Voucher already redeemed", ft.Colors.RED)
-                return
-
-            vouchers.append((hid, denom, idx, code))
-            total += denom
+        # Newer activation records carry the parsed triples; fall back to
+        # parsing the codes for records written before that.
+        if "vouchers" in record:
+            vouchers = [(v["hid"], v["denom"], v["idx"], v["code"])
+                        for v in record["vouchers"]]
+        else:
+            vouchers = [registry.parse_voucher_code(code) + (code,)
+                        for code in record["voucher_codes"]]
+
+        # One combined-mask AND per (household, denomination) group covers
+        # the whole duplicate check.
+        if registry.any_voucher_used(
+            (hid, denom, idx) for hid, denom, idx, _ in vouchers
+        ):
+            show_result("Declined", "Voucher already redeemed", ft.Colors.RED)
+            return
 
-        for hid, denom, idx, _ in vouchers:
-            registry.household_voucher_state[hid][str(denom)][idx] = 1
+        total = sum(denom for _, denom, _, _ in vouchers)
 
-        registry.save_voucher_state()
+        # The bulk mark flags the state dirty; the registry's debounced
+        # writer persists one coalesced snapshot shortly after the burst.
+        registry.mark_vouchers_used(
+            (hid, denom, idx) for hid, denom, idx, _ in vouchers
+        )
 
         tx_id = get_next_transaction_id()
         ts = datetime.now().strftime("%Y%m%d%H%M%S")
 
-        with open(TRANSACTIONS_CSV, "a", newline="", encoding="utf-8") as f:
-            w = csv.writer(f)
-            for i, (hid, denom, _, code) in enumerate(vouchers):
-                w.writerow([
-                    tx_id,
-                    hid,
-                    merchant_id,
-                    ts,
-                    code,
-                    f"${denom}.00",
-                    f"${total}.00",
-                    "Completed",
-                    "Final" if i == len(vouchers) - 1 else str(i + 1)
-                ])
+        tx_rows = [
+            {
+                "Transaction_ID": tx_id,
+                "Household_ID": hid,
+                "Merchant_ID": merchant_id,
+                "Transaction_Date_Time": ts,
+                "Voucher_Code": code,
+                "Denomination_Used": f"${denom}.00",
+                "Amount_Redeemed": f"${total}.00",
+                "Payment_Status": "Completed",
+                "Remarks": "Final" if i == len(vouchers) - 1 else str(i + 1)
+            }
+            for i, (hid, denom, _, code) in enumerate(vouchers)
+        ]
+
+        _append_transactions(tx_rows)
 
         show_result("Success", f"{tx_id} | Amount ${total}", ft.Colors.GREEN)
 
     # ================= HISTORY =================
 
-    def show_history():
-        clear()
+    # Rows rendered per history page: one ft.DataRow per transaction is
+    # what makes this view heavy, so older rows stay unbuilt until asked.
+    HISTORY_PAGE = 200
+
+    def show_history(limit=HISTORY_PAGE):
+        history = _load_tx_index().get(merchant_id, [])
+        hidden = max(len(history) - limit, 0)
         rows = []
 
-        if os.path.exists(TRANSACTIONS_CSV):
-            with open(TRANSACTIONS_CSV, "r", encoding="utf-8") as f:
-                for r in csv.DictReader(f):
-                    if r["Merchant_ID"] == merchant_id:
-                        rows.append(
-                            ft.DataRow(
-                                cells=[
-                                    ft.DataCell(ft.Text(r["Transaction_ID"])),
-                                    ft.DataCell(ft.Text(r["Transaction_Date_Time"])),
-                                    ft.DataCell(ft.Text(r["Voucher_Code"])),
-                                    ft.DataCell(ft.Text(r["Denomination_Used"])),
-                                ]
-                            )
-                        )
+        # Only the most recent `limit` rows become controls (the file is
+        # chronological, so that is the tail).
+        for r in history[hidden:]:
+            rows.append(
+                ft.DataRow(
+                    cells=[
+                        ft.DataCell(ft.Text(r["Transaction_ID"])),
+                        ft.DataCell(ft.Text(r["Transaction_Date_Time"])),
+                        ft.DataCell(ft.Text(r["Voucher_Code"])),
+                        ft.DataCell(ft.Text(r["Denomination_Used"])),
+                    ]
+                )
+            )
 
-        page.controls.append(
-            ft.Column(
-                [
-                    ft.Text("Transaction History", size=20, weight=ft.FontWeight.BOLD),
-                    ft.DataTable(
-                        columns=[
-                            ft.DataColumn(ft.Text("Tx ID")),
-                            ft.DataColumn(ft.Text("Date")),
-                            ft.DataColumn(ft.Text("Voucher")),
-                            ft.DataColumn(ft.Text("Amount")),
-                        ],
-                        rows=rows,
-                    ),
-                    ft.OutlinedButton("Back", on_click=show_dashboard),
+        controls = [
+            ft.Text("Transaction History", size=20, weight=ft.FontWeight.BOLD),
+            ft.DataTable(
+                columns=[
+                    ft.DataColumn(ft.Text("Tx ID")),
+                    ft.DataColumn(ft.Text("Date")),
+                    ft.DataColumn(ft.Text("Voucher")),
+                    ft.DataColumn(ft.Text("Amount")),
                 ],
-                expand=True,
+                rows=rows,
+            ),
+        ]
+        if hidden:
+            controls.append(
+                ft.TextButton(
+                    f"Load more ({hidden} older)",
+                    on_click=lambda e, n=limit: show_history(n + HISTORY_PAGE),
+                )
             )
-        )
+        controls.append(ft.OutlinedButton("Back", on_click=show_dashboard))
+
+        history_view.controls = controls
+        _show(history_view)
         page.update()
 
     # ================= RESULT =================
 
     def show_result(title, message, color):
-        clear()
-        page.controls.append(
-            ft.Column(
-                [
-                    ft.Text(title, size=22, weight=ft.FontWeight.BOLD, color=color),
-                    ft.Text(message),
-                    ft.ElevatedButton("Back", on_click=show_dashboard),
-                ],
-                expand=True,
-            )
-        )
+        result_title.value = title
+        result_title.color = color
+        result_message.value = message
+        _show(result_view)
         page.update()
 
     # ================= LOGOUT =================
@@ -248,8 +395,52 @@ def main(page: ft.Page):
         merchant_id = None
         show_login()
 
+    # ================= VIEWS =================
+
+    login_view = ft.Column(
+        [
+            ft.Text("CDC Merchant Portal", size=24, weight=ft.FontWeight.BOLD),
+            merchant_input,
+            error_text,
+            ft.ElevatedButton("Login", on_click=handle_login),
+        ],
+        alignment=ft.MainAxisAlignment.CENTER,
+        horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+        expand=True,
+        visible=False,
+    )
+
+    dashboard_view = ft.Column(
+        [
+            ft.Text("Merchant Dashboard", size=20, weight=ft.FontWeight.BOLD),
+            barcode_input,
+            ft.ElevatedButton("Redeem Voucher", on_click=redeem_voucher),
+            ft.OutlinedButton("View History", on_click=lambda e: show_history()),
+            ft.TextButton("Logout", on_click=logout),
+        ],
+        expand=True,
+        visible=False,
+    )
+
+    # History rows depend on the data, so only the container is
+    # persistent; show_history fills in its controls per render.
+    history_view = ft.Column(expand=True, visible=False)
+
+    result_title = ft.Text(size=22, weight=ft.FontWeight.BOLD)
+    result_message = ft.Text()
+    result_view = ft.Column(
+        [
+            result_title,
+            result_message,
+            ft.ElevatedButton("Back", on_click=show_dashboard),
+        ],
+        expand=True,
+        visible=False,
+    )
+
     # ================= START =================
 
+    page.add(login_view, dashboard_view, history_view, result_view)
     show_login()
 
 # ================== RUN ==================